@@ -0,0 +1,61 @@
+import threading
+from functools import wraps
+from cachetools import TTLCache
+from .config import CACHE_TTL_SECONDS, CACHE_MAXSIZE
+
+# Cache-aside en memoria para lecturas por empleado (niveles de skills).
+# Las claves son (eid, *args); invalidate(*eids) las descarta cuando el grafo cambia.
+
+_caches = []
+_lock = threading.Lock()
+
+
+def cached(ttl=CACHE_TTL_SECONDS, maxsize=CACHE_MAXSIZE):
+    """Decora funciones bulk `f(eids, *args, session=None) -> {eid: value}`.
+
+    Solo consulta los eids que no estén en cache (una llamada para todos los misses)
+    y guarda cada resultado por separado, así requests con candidatos solapados
+    comparten entradas. Los args de tipo lista se normalizan a tuplas ordenadas.
+    """
+    def decorator(fn):
+        store = TTLCache(maxsize=maxsize, ttl=ttl)
+        _caches.append(store)
+
+        @wraps(fn)
+        def wrapper(eids, *args, session=None):
+            frozen = _freeze(args)
+            out, misses = {}, []
+            with _lock:
+                for eid in eids:
+                    hit = store.get((eid,) + frozen)
+                    if hit is None:
+                        misses.append(eid)
+                    else:
+                        out[eid] = hit
+            if misses:
+                fetched = fn(misses, *args, session=session)
+                with _lock:
+                    for eid in misses:
+                        out[eid] = store[(eid,) + frozen] = fetched.get(eid)
+            return out
+
+        wrapper.cache = store
+        return wrapper
+    return decorator
+
+
+def _freeze(args):
+    # listas/sets -> tuplas ordenadas, para que el orden de los skills no cambie la clave
+    return tuple(tuple(sorted(a)) if isinstance(a, (list, tuple, set, frozenset)) else a for a in args)
+
+
+def invalidate(*eids):
+    """Descarta las entradas de los empleados dados (o todas si no se pasa ninguno)."""
+    targets = set(eids)
+    with _lock:
+        for store in _caches:
+            if not targets:
+                store.clear()
+                continue
+            for key in [k for k in store.keys() if k[0] in targets]:
+                store.pop(key, None)
@@ -3,4 +3,13 @@ import os
 
 NEO4J_URI = os.getenv('NEO4J_URI', 'bolt://localhost:7687')
 NEO4J_USER = os.getenv('NEO4J_USER', 'neo4j')
-NEO4J_PASS = os.getenv('NEO4J_PASS', 'neo4jpasswd')
\ No newline at end of file
+NEO4J_PASS = os.getenv('NEO4J_PASS', 'neo4jpasswd')
+# Cache en memoria de lecturas por empleado (segundos / nº de entradas)
+CACHE_TTL_SECONDS = int(os.getenv('CACHE_TTL_SECONDS', '300'))
+CACHE_MAXSIZE = int(os.getenv('CACHE_MAXSIZE', '10000'))
+
+# Pool / fetch del driver Neo4j
+NEO4J_POOL_SIZE = int(os.getenv('NEO4J_POOL_SIZE', '100'))
+NEO4J_ACQUISITION_TIMEOUT = float(os.getenv('NEO4J_ACQUISITION_TIMEOUT', '30'))
+NEO4J_MAX_CONNECTION_LIFETIME = float(os.getenv('NEO4J_MAX_CONNECTION_LIFETIME', '1200'))
+NEO4J_FETCH_SIZE = int(os.getenv('NEO4J_FETCH_SIZE', '1000'))
@@ -1,9 +1,54 @@
+import atexit
+from contextlib import contextmanager
 from neo4j import GraphDatabase
-from .config import NEO4J_URI, NEO4J_USER, NEO4J_PASS
+from .config import (
+    NEO4J_URI, NEO4J_USER, NEO4J_PASS,
+    NEO4J_POOL_SIZE, NEO4J_ACQUISITION_TIMEOUT, NEO4J_MAX_CONNECTION_LIFETIME, NEO4J_FETCH_SIZE,
+)
 
 
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASS))
+driver = GraphDatabase.driver(
+    NEO4J_URI,
+    auth=(NEO4J_USER, NEO4J_PASS),
+    max_connection_pool_size=NEO4J_POOL_SIZE,
+    connection_acquisition_timeout=NEO4J_ACQUISITION_TIMEOUT,
+    max_connection_lifetime=NEO4J_MAX_CONNECTION_LIFETIME,
+    keep_alive=True,
+    fetch_size=NEO4J_FETCH_SIZE,
+)
+atexit.register(driver.close)
 
 
 def get_driver():
-    return driver
\ No newline at end of file
+    return driver
+
+
+@contextmanager
+def session_scope(session=None):
+    # reutiliza la sesión del caller si la hay; si no, abre una propia
+    if session is not None:
+        yield session
+    else:
+        with driver.session() as s:
+            yield s
+
+
+def execute_read(query, session=None, **params):
+    # transacción de lectura explícita (reintentos del driver, ruteo a réplicas); devuelve filas como dicts
+    with session_scope(session) as s:
+        return s.execute_read(lambda tx: tx.run(query, **params).data())
+
+
+# Índices para los lookups por clave que usan todas las consultas (MATCH/MERGE por id, name, uid).
+# scripts/migrate_evidences_to_nodes.py los reemplaza por constraints de unicidad cuando los datos lo permiten.
+INDEXES = [
+    "CREATE INDEX empleado_id IF NOT EXISTS FOR (e:Empleado) ON (e.id)",
+    "CREATE INDEX skill_name IF NOT EXISTS FOR (s:Skill) ON (s.name)",
+    "CREATE INDEX evidence_uid IF NOT EXISTS FOR (ev:Evidence) ON (ev.uid)",
+]
+
+
+def ensure_indexes():
+    with driver.session() as s:
+        for q in INDEXES:
+            s.run(q).consume()
@@ -1,49 +1,96 @@
-from typing import List, Dict, Any
-from .db import driver
+from typing import List, Dict, Any, Optional
+from collections import Counter
+from dataclasses import dataclass, field
+from functools import lru_cache
+from .db import session_scope, execute_read
+from .cache import cached
 from datetime import date
 import networkx as nx
+import numpy as np
 import math
 
-# Helpers: obtener candidatos que cumplen hard reqs
-def filter_candidates(hard: dict) -> List[Dict]:
-    # hard example: {'skills':['Facturación','Java'], 'acceso':['sistemaX'], 'zona':['PE/Lima']}
-    # Devuelve lista de empleados (id, nombre, metadata)
-    query = """
+# Consultas Cypher (texto estable + parámetros: Neo4j reutiliza el plan cacheado)
+_Q_FILTER_CANDIDATES_WHERE = """
     MATCH (e:Empleado)
     WHERE ALL(s IN $skills WHERE EXISTS((e)-[:DEMUESTRA_COMPETENCIA]->(:Skill {name:s})))
       AND ($acceso IS NULL OR ANY(a IN $acceso WHERE a IN coalesce(e.acceso,[])))
       AND ($zonas IS NULL OR e.zona IN $zonas)
+"""
+_Q_FILTER_CANDIDATES = _Q_FILTER_CANDIDATES_WHERE + """
     RETURN e.id as id, e.nombre as nombre, e
-    """
-    with driver.session() as session:
-        result = session.run(query, skills=hard.get('skills',[]), acceso=hard.get('acceso',None), zonas=hard.get('zona',None))
-        return [r.data()['e'] if 'e' in r.data() else {'id':r['id'],'nombre':r['nombre']} for r in result]
+"""
+# solo aristas entre candidatos (lo único que usa el grafo local), no todos los colegas
+_Q_FILTER_CANDIDATES_WITH_EDGES = _Q_FILTER_CANDIDATES_WHERE + """
+    WITH collect(e) AS cands, collect(e.id) AS ids
+    UNWIND cands AS e
+    OPTIONAL MATCH (e)-[r:HA_COLABORADO_CON]-(b:Empleado)
+    WHERE b.id IN ids
+    WITH e, collect(CASE WHEN b IS NULL THEN NULL ELSE {a:e.id, b:b.id, proyectos:r.proyectosComunes, pos:r.interaccionesPositivas,
+         conf:r.interaccionesConflictivas, freq:r.frecuencia, rec:r.recencia} END) AS edges
+    // la agregación no conserva el orden del MATCH: orden fijo para desempates reproducibles
+    ORDER BY e.id
+    RETURN e.id as id, e.nombre as nombre, e, edges
+"""
+# Prefer Evidence nodes model; fall back to legacy r.evidencias
+# only the EVIDENCE_LIMIT most recent evidence nodes per skill travel over Bolt
+_Q_SKILL_LEVELS = """
+    UNWIND $eids AS eid
+    MATCH (e:Empleado {id:eid})-[r:DEMUESTRA_COMPETENCIA]->(s:Skill)
+    WHERE s.name IN $skills
+    CALL {
+      WITH e, s
+      OPTIONAL MATCH (e)-[:HAS_EVIDENCE]->(ev:Evidence)-[:ABOUT]->(s)
+      WITH ev ORDER BY ev.date IS NULL, ev.date DESC
+      LIMIT $ev_limit
+      RETURN collect(CASE WHEN ev IS NULL THEN NULL ELSE {url:ev.url, date:ev.date, actor:ev.actor, source:ev.source, id:ev.uid, raw:ev.raw} END) AS evs
+    }
+    RETURN e.id as eid, s.name as skill, r.nivel as nivel, evs AS evidencias_nodes, r.evidencias AS evidencias_legacy, r.ultimaDemostracion as ultima
+"""
+
+# Helpers: obtener candidatos que cumplen hard reqs
+def filter_candidates(hard: dict, session=None) -> List[Dict]:
+    # hard example: {'skills':['Facturación','Java'], 'acceso':['sistemaX'], 'zona':['PE/Lima']}
+    # Devuelve lista de empleados (id, nombre, metadata)
+    rows = execute_read(_Q_FILTER_CANDIDATES, session=session, skills=hard.get('skills',[]), acceso=hard.get('acceso',None), zonas=hard.get('zona',None))
+    return [_candidate(r) for r in rows]
+
+# Igual que filter_candidates, más las aristas HA_COLABORADO_CON entre candidatos en el mismo
+# round-trip: (candidatos, {eid: [rows]}) listo para build_local_graph
+def filter_candidates_with_edges(hard: dict, session=None):
+    rows = execute_read(_Q_FILTER_CANDIDATES_WITH_EDGES, session=session, skills=hard.get('skills',[]), acceso=hard.get('acceso',None), zonas=hard.get('zona',None))
+    return [_candidate(r) for r in rows], {r['id']: r['edges'] for r in rows}
+
+def _candidate(r) -> Dict:
+    return r['e'] if r['e'] is not None else {'id':r['id'],'nombre':r['nombre']}
 
 # Construye grafo local de colaboración entre candidatos y extrae métricas
-def build_local_graph(candidate_ids: List[str]) -> nx.Graph:
+# edges: {eid: [rows]} ya leídas junto con los candidatos (filter_candidates_with_edges)
+def build_local_graph(candidate_ids: List[str], edges: Dict[str, List[Dict]]) -> nx.Graph:
     G = nx.Graph()
     G.add_nodes_from(candidate_ids)
     # recuperar relaciones factuales entre candidatos
-    query = """
-    UNWIND $ids AS id1
-    MATCH (a:Empleado {id:id1})-[r:HA_COLABORADO_CON]-(b:Empleado)
-    WHERE b.id IN $ids
-    RETURN a.id as a, b.id as b, r.proyectosComunes as proyectos, r.interaccionesPositivas as pos,
-           r.interaccionesConflictivas as conf, r.frecuencia as freq, r.recencia as rec
-    """
-    with driver.session() as s:
-        res = s.run(query, ids=candidate_ids)
-        for r in res:
-            a = r['a']; b = r['b']
-            weight = compute_edge_strength(r)
-            G.add_edge(a,b, weight=weight,
-                       proyectos=r.get('proyectos',[]),
-                       pos=r.get('pos',0),
-                       conf=r.get('conf',0),
-                       freq=r.get('freq',0),
-                       rec=r.get('rec', None))
+    ids = set(candidate_ids)
+    rows = [r for a in candidate_ids for r in edges.get(a, []) if r['b'] in ids]
+    weights = compute_edge_strengths(rows)
+    G.add_edges_from((r['a'], r['b'], {'weight': float(weight),
+                                       'proyectos': r['proyectos'] or [],
+                                       'pos': r['pos'] or 0,
+                                       'conf': r['conf'] or 0,
+                                       'freq': r['freq'] or 0,
+                                       'rec': r['rec']})
+                     for r, weight in zip(rows, weights))
+    weight_matrix(G)
     return G
 
+# Matriz densa de pesos del grafo local (una vez por grafo): ({eid: fila}, W)
+def weight_matrix(G: nx.Graph):
+    if 'W' not in G.graph:
+        nodes = list(G.nodes)
+        G.graph['node_index'] = {n: i for i, n in enumerate(nodes)}
+        G.graph['W'] = nx.to_numpy_array(G, nodelist=nodes, weight='weight')
+        G.graph['strength'] = G.graph['W'].sum(axis=1)  # grado ponderado por fila
+    return G.graph['node_index'], G.graph['W']
+
 def compute_edge_strength(rec):
     # heurística: (pos - conf*2) * log(1+freq) * freshness_factor
     pos = rec.get('pos',0) or 0
@@ -51,227 +98,367 @@ def compute_edge_strength(rec):
     freq = rec.get('freq',0) or 0.0
     freshness = 1.0
     # si recencia es vieja, bajar
-    try:
-        rec_date = rec.get('rec')
-        if rec_date:
-            # asume ISO date
-            d = date.fromisoformat(rec_date)
-            days = (date.today() - d).days
-            freshness = 1.0 if days < 90 else max(0.2, 1 - days/365.0)
-    except:
-        freshness = 1.0
+    rec_ord = _date_ordinal(rec.get('rec'))
+    if rec_ord >= 0:
+        days = date.today().toordinal() - rec_ord
+        freshness = 1.0 if days < 90 else max(0.2, 1 - days/365.0)
     score = max(0.0, (pos - 2*conf)) * math.log(1+freq+1) * freshness
     return score
 
+# Misma heurística que compute_edge_strength, en una pasada vectorizada sobre todas las aristas
+def compute_edge_strengths(recs) -> np.ndarray:
+    pos = np.array([r.get('pos',0) or 0 for r in recs], dtype=float)
+    conf = np.array([r.get('conf',0) or 0 for r in recs], dtype=float)
+    freq = np.array([r.get('freq',0) or 0.0 for r in recs], dtype=float)
+    rec_ord = np.array([_date_ordinal(r.get('rec')) for r in recs], dtype=float)
+    days = date.today().toordinal() - rec_ord
+    # recencia desconocida (-1) o < 90 días: sin penalización
+    freshness = np.where((rec_ord < 0) | (days < 90), 1.0, np.maximum(0.2, 1 - days/365.0))
+    return np.maximum(0.0, pos - 2*conf) * np.log(1+freq+1) * freshness
+
+# Ordinal de una fecha (ISO 'YYYY-MM-DD' o datetime ISO); -1 si falta o no se puede parsear
+def _date_ordinal(value) -> int:
+    if not value:
+        return -1
+    return _iso_to_ordinal(str(value)[:10])
+
+@lru_cache(maxsize=65536)
+def _iso_to_ordinal(s: str) -> int:
+    try:
+        return date.fromisoformat(s).toordinal()
+    except ValueError:
+        return -1
+
+EVIDENCE_LIMIT = 3  # evidencias más recientes por skill que se devuelven en justificaciones
+
 # Obtiene competencia (nivel) por skill de un empleado
-def get_employee_skill_levels(emp_id, skills):
-    # Prefer Evidence nodes model; fall back to legacy r.evidencias
-    q = """
-    MATCH (e:Empleado {id:$eid})-[r:DEMUESTRA_COMPETENCIA]->(s:Skill)
-    WHERE s.name IN $skills
-    OPTIONAL MATCH (e)-[:HAS_EVIDENCE]->(ev:Evidence)-[:ABOUT]->(s)
-    WITH s, r, collect(CASE WHEN ev IS NULL THEN NULL ELSE {url:ev.url, date:ev.date, actor:ev.actor, source:ev.source, id:ev.uid, raw:ev.raw} END) AS evs
-    RETURN s.name as skill, r.nivel as nivel, evs AS evidencias_nodes, r.evidencias AS evidencias_legacy, r.ultimaDemostracion as ultima
-    """
-    with driver.session() as s:
-        res = s.run(q, eid=emp_id, skills=skills)
-        out = {}
-        for r in res:
-            skill = r['skill']
-            nivel = r['nivel'] or 0.0
-            ev_nodes = r.get('evidencias_nodes') or []
-            ev_legacy = r.get('evidencias_legacy') or []
-            evids = []
-            # use nodes when present
-            if ev_nodes and any(e for e in ev_nodes if e is not None):
-                for ev in ev_nodes:
-                    if not ev:
+def get_employee_skill_levels(emp_id, skills, session=None):
+    return get_bulk_skill_levels([emp_id], skills, session=session).get(emp_id, {})
+
+# Obtiene niveles de varios empleados en un solo round-trip: {eid: {skill: info}}
+@cached()
+def get_bulk_skill_levels(emp_ids, skills, session=None) -> Dict[str, Dict[str, Dict]]:
+    out = {eid: {} for eid in emp_ids}
+    if not emp_ids or not skills:
+        return out
+    rows = execute_read(_Q_SKILL_LEVELS, session=session, eids=list(emp_ids), skills=list(skills), ev_limit=EVIDENCE_LIMIT)
+    for r in rows:
+        out[r['eid']][r['skill']] = _skill_info_from_record(r)
+    return out
+
+def _skill_info_from_record(r) -> Dict:
+    nivel = r['nivel'] or 0.0
+    ev_nodes = r['evidencias_nodes'] or []
+    ev_legacy = r['evidencias_legacy'] or []
+    evids = []
+    # use nodes when present
+    if ev_nodes and any(e for e in ev_nodes if e is not None):
+        for ev in ev_nodes:
+            if not ev:
+                continue
+            evids.append({'url': ev.get('url'), 'date': ev.get('date'), 'actor': ev.get('actor'), 'source': ev.get('source'), 'id': ev.get('id'), 'raw': ev.get('raw')})
+    else:
+        # parse legacy entries: could be plain URL or JSON string
+        for it in ev_legacy:
+            if not it:
+                continue
+            if isinstance(it, str):
+                s_it = it.strip()
+                if s_it[:1] == '{':
+                    try:
+                        obj = __import__('json').loads(s_it)
+                        evids.append({'url': obj.get('url'), 'date': obj.get('date'), 'actor': obj.get('actor'), 'source': obj.get('source'), 'id': obj.get('id'), 'raw': s_it})
                         continue
-                    evids.append({'url': ev.get('url'), 'date': ev.get('date'), 'actor': ev.get('actor'), 'source': ev.get('source'), 'id': ev.get('id'), 'raw': ev.get('raw')})
+                    except Exception:
+                        pass
+                # plain url
+                evids.append({'url': s_it, 'date': None, 'actor': None, 'source': None, 'id': None, 'raw': s_it})
             else:
-                # parse legacy entries: could be plain URL or JSON string
-                for it in ev_legacy:
-                    if not it:
-                        continue
-                    if isinstance(it, str):
-                        s_it = it.strip()
-                        if s_it.startswith('{') and s_it.endswith('}'):
-                            try:
-                                obj = __import__('json').loads(s_it)
-                                evids.append({'url': obj.get('url'), 'date': obj.get('date'), 'actor': obj.get('actor'), 'source': obj.get('source'), 'id': obj.get('id'), 'raw': s_it})
-                                continue
-                            except Exception:
-                                pass
-                        # plain url
-                        evids.append({'url': s_it, 'date': None, 'actor': None, 'source': None, 'id': None, 'raw': s_it})
-                    else:
-                        # unknown type
-                        evids.append({'url': str(it), 'date': None, 'actor': None, 'source': None, 'id': None, 'raw': str(it)})
-            out[skill] = {'nivel': nivel, 'evidencias': evids, 'ultima': r.get('ultima')}
-        return out
+                # unknown type
+                evids.append({'url': str(it), 'date': None, 'actor': None, 'source': None, 'id': None, 'raw': str(it)})
+        # legacy list is not ordered server-side: most recent first (int compare on ordinals)
+        evids = sorted(evids, key=lambda x: _date_ordinal(x.get('date')), reverse=True)[:EVIDENCE_LIMIT]
+    return {'nivel': nivel, 'evidencias': evids, 'ultima': r['ultima']}
+
+EXPERT_LEVEL = 3  # threshold SPoF / cobertura de linchpins
+
+# Perfil precalculado por empleado: (skills con nivel >= 1, suma y nº de esos niveles, skills con nivel >= EXPERT_LEVEL)
+def skill_profiles(levels: Dict[str, Dict[str, Dict]]) -> Dict[str, tuple]:
+    out = {}
+    for eid, skills in levels.items():
+        cov, profs, experts = [], [], []
+        for s, info in skills.items():
+            nivel = info['nivel']
+            if nivel and nivel >= 1:
+                cov.append(s)
+                profs.append(nivel)
+            if nivel >= EXPERT_LEVEL:
+                experts.append(s)
+        out[eid] = (tuple(cov), sum(profs), len(profs), tuple(experts))
+    return out
+
+# skill -> set(eids con nivel >= EXPERT_LEVEL), a partir de los niveles precargados
+def skill_experts(levels: Dict[str, Dict[str, Dict]]) -> Dict[str, set]:
+    experts = {}
+    for eid, (_, _, _, skills) in skill_profiles(levels).items():
+        for s in skills:
+            experts.setdefault(s, set()).add(eid)
+    return experts
+
+_EMPTY_PROFILE = ((), 0.0, 0, ())
+
+# Estado incremental de un equipo: agregar/quitar/evaluar un miembro cuesta O(team + skills)
+@dataclass
+class TeamState:
+    required_skills: List[str]
+    levels: Dict[str, Dict[str, Dict]]  # {eid: {skill: info}} precargado
+    G: nx.Graph
+    profiles: Optional[Dict[str, tuple]] = None  # skill_profiles(levels), compartible entre estados
+    members: List[str] = field(default_factory=list)
+    covered: Counter = field(default_factory=Counter)  # skill -> miembros con nivel >= 1
+    skill_redundancy: Counter = field(default_factory=Counter)  # skill -> miembros con nivel >= EXPERT_LEVEL
+    profs_sum: float = 0.0
+    profs_n: int = 0
+    edge_weight_sum: float = 0.0
+
+    def __post_init__(self):
+        if self.profiles is None:
+            self.profiles = skill_profiles(self.levels)
+
+    def _profile(self, eid):
+        return self.profiles.get(eid, _EMPTY_PROFILE)
+
+    def _edges_to(self, eid, others):
+        index, W = weight_matrix(self.G)
+        i = index.get(eid)
+        idx = [index[m] for m in others if m in index]
+        if i is None or not idx:
+            return 0.0
+        return float(W[i, idx].sum())
+
+    def add(self, eid):
+        cov, p_sum, p_n, experts = self._profile(eid)
+        self.edge_weight_sum += self._edges_to(eid, self.members)
+        self.members.append(eid)
+        self.covered.update(cov)
+        self.skill_redundancy.update(experts)
+        self.profs_sum += p_sum
+        self.profs_n += p_n
+
+    def swap(self, out_eid, in_eid):
+        # reemplaza en la misma posición para conservar el orden del equipo
+        cov, p_sum, p_n, experts = self._profile(out_eid)
+        idx = self.members.index(out_eid)
+        self.edge_weight_sum -= self._edges_to(out_eid, self.members)
+        self.members[idx] = in_eid
+        self.edge_weight_sum += self._edges_to(in_eid, [m for m in self.members if m != in_eid])
+        self.covered.subtract(cov)
+        self.skill_redundancy.subtract(experts)
+        self.profs_sum -= p_sum
+        self.profs_n -= p_n
+        cov, p_sum, p_n, experts = self._profile(in_eid)
+        self.covered.update(cov)
+        self.skill_redundancy.update(experts)
+        self.profs_sum += p_sum
+        self.profs_n += p_n
+
+    def metrics(self):
+        return self.metrics_with()
+
+    def metrics_with(self, add: Optional[str] = None, drop: Optional[str] = None):
+        # métricas del equipo con `add` incorporado y/o `drop` retirado, sin mutar el estado
+        covered = dict(self.covered)
+        redundancy = dict(self.skill_redundancy)
+        profs_sum, profs_n = self.profs_sum, self.profs_n
+        others = [m for m in self.members if m != drop]
+        edge_sum = self.edge_weight_sum
+        n = len(others)
+        if drop is not None:
+            edge_sum -= self._edges_to(drop, others)
+            cov, p_sum, p_n, experts = self._profile(drop)
+            for s in cov:
+                covered[s] -= 1
+            for s in experts:
+                redundancy[s] -= 1
+            profs_sum -= p_sum
+            profs_n -= p_n
+        if add is not None:
+            edge_sum += self._edges_to(add, others)
+            n += 1
+            cov, p_sum, p_n, experts = self._profile(add)
+            for s in cov:
+                covered[s] = covered.get(s, 0) + 1
+            for s in experts:
+                redundancy[s] = redundancy.get(s, 0) + 1
+            profs_sum += p_sum
+            profs_n += p_n
+        n_skills = max(1, len(self.required_skills))
+        S_skill = sum(1 for v in covered.values() if v > 0) / n_skills
+        S_exp = (profs_sum / profs_n / 5.0) if profs_n else 0.0
+        # Cohesión: densidad weighted
+        if n <= 1:
+            cohesion = 0.0
+        else:
+            total_possible = n * (n - 1) / 2
+            # Normalize: divide por total_possible * max_edge_empiric (tuneable)
+            cohesion = min(1.0, edge_sum / (total_possible * 10.0))  # 10.0 ~ expected max weight
+        # SPoF: skills cubiertos por un único experto
+        spof = sum(1 for v in redundancy.values() if v == 1)
+        return {
+            'S_skill': S_skill,
+            'S_exp': S_exp,
+            'Cohesion': cohesion,
+            'SPoF_risk': spof / n_skills
+        }
 
 # Scoring parcial explicable
-def compute_team_metrics(team_ids: List[str], required_skills: List[str], G: nx.Graph):
-    # Cobertura de skills:
-    covered = set()
-    profs = []
+def compute_team_metrics(team_ids: List[str], required_skills: List[str], G: nx.Graph, levels: Optional[Dict] = None, session=None):
+    if levels is None:
+        # una sola consulta para todo el equipo
+        levels = get_bulk_skill_levels(team_ids, required_skills, session=session)
+    state = TeamState(required_skills, levels, G)
     for eid in team_ids:
-        levels = get_employee_skill_levels(eid, required_skills)
-        for s,info in levels.items():
-            if info['nivel'] and info['nivel'] >= 1:
-                covered.add(s)
-                profs.append(info['nivel'])
-    S_skill = len(covered)/max(1,len(required_skills))
-    S_exp = (sum(profs)/len(profs)/5.0) if profs else 0.0
-    # Cohesión: densidad weighted
-    sub = G.subgraph(team_ids)
-    if sub.number_of_nodes() <= 1:
-        cohesion = 0.0
-    else:
-        total_possible = sub.number_of_nodes() * (sub.number_of_nodes()-1) / 2
-        actual_sum = sum([d['weight'] for _,_,d in sub.edges(data=True)])
-        # Normalize: divide por total_possible * max_edge_empiric (tuneable)
-        cohesion = actual_sum / (total_possible * 10.0)  # 10.0 ~ expected max weight
-        cohesion = min(1.0, cohesion)
-    # SPoF: contar skills that have single employee coverage
-    skill_count = {}
-    for s in required_skills:
-        skill_count[s] = 0
-        for eid in team_ids:
-            levels = get_employee_skill_levels(eid, [s])
-            if levels.get(s) and levels[s]['nivel'] >= 3:  # threshold
-                skill_count[s] += 1
-    spof = sum(1 for v in skill_count.values() if v==1)
-    spof_risk = spof / max(1,len(required_skills))
-    return {
-        'S_skill': S_skill,
-        'S_exp': S_exp,
-        'Cohesion': cohesion,
-        'SPoF_risk': spof_risk
-    }
+        state.add(eid)
+    return state.metrics()
 
 # Núcleo: buscar linchpins (puentes con skills críticos y alta conectividad)
-def find_linchpins(candidate_ids: List[str], required_skills: List[str], G: nx.Graph, top_k=2):
-    scores = {}
-    for eid in candidate_ids:
-        # skill coverage on required
-        levels = get_employee_skill_levels(eid, required_skills)
-        coverage = sum(1 for s in levels if levels[s]['nivel'] >= 3)
-        degree = G.degree(eid, weight='weight') if eid in G else 0
-        # combinar: priorizar coverage then connectivity
-        scores[eid] = coverage * 10 + degree
-    ordered = sorted(scores.items(), key=lambda x: x[1], reverse=True)
-    return [x[0] for x in ordered[:top_k]]
+def find_linchpins(candidate_ids: List[str], required_skills: List[str], G: nx.Graph, top_k=2, levels: Optional[Dict] = None, session=None):
+    if not candidate_ids:
+        return []
+    candidate_levels = levels if levels is not None else get_bulk_skill_levels(candidate_ids, required_skills, session=session)
+    experts = skill_experts(candidate_levels)
+    index, _ = weight_matrix(G)
+    n = len(candidate_ids)
+    # skill coverage on required
+    coverage = np.fromiter((sum(1 for eids in experts.values() if eid in eids) for eid in candidate_ids), dtype=float, count=n)
+    # grado ponderado precalculado; fila -1 -> 0.0 para ids fuera del grafo
+    rows = np.fromiter((index.get(eid, -1) for eid in candidate_ids), dtype=int, count=n)
+    degree = np.append(G.graph['strength'], 0.0)[rows]
+    # combinar: priorizar coverage then connectivity
+    scores = coverage * 10 + degree
+    # stable: a igual score conserva el orden de candidatos
+    order = np.argsort(-scores, kind='stable')[:top_k]
+    return [candidate_ids[i] for i in order]
 
 # Algoritmo Guardián (versión compilable)
-def propose_teams(request: dict) -> List[dict]:
+def propose_teams(request: dict, session=None) -> List[dict]:
+    # una sola sesión Neo4j para todas las consultas del request
+    with session_scope(session) as s:
+        return _propose_teams(request, s)
+
+def _propose_teams(request: dict, session) -> List[dict]:
     hard = request.get('requisitos_hard', {})
     profile = request.get('perfil_mision','mantenimiento')
     k = request.get('k', 5)
     preferences = request.get('preferences', {})
 
-    # 1) Candidatos
-    candidates_raw = filter_candidates(hard)
+    # 1) Candidatos (con sus aristas de colaboración en la misma consulta)
+    candidates_raw, edges = filter_candidates_with_edges(hard, session=session)
     candidate_ids = [c['id'] for c in candidates_raw]
+    # info básica (id, nombre, rol) de los candidatos: ya viene en el resultado del filtro
+    members_info = {c['id']: {'id': c['id'], 'nombre': c.get('nombre') or c['id'], 'rol': c.get('rol')} for c in candidates_raw}
 
-    # 2) Build local graph
-    G = build_local_graph(candidate_ids)
+    # 2) Build local graph (aristas ya leídas) y niveles de todos los candidatos
+    G = build_local_graph(candidate_ids, edges)
+    # única consulta de skills del request
+    levels = get_bulk_skill_levels(candidate_ids, hard.get('skills',[]), session=session)
 
     # 3) Linchpins (nucleus)
-    nucleus = find_linchpins(candidate_ids, hard.get('skills',[]), G, top_k=2)
+    nucleus = find_linchpins(candidate_ids, hard.get('skills',[]), G, top_k=2, levels=levels)
 
-    proposals = []
     # generamos 3 propuestas: balance, cohesion_max, redundancy_max
+    # (cada modo es cómputo en memoria sobre los datos precargados)
     modes = ['balance','cohesion','redundancy']
-    for mode in modes:
-        team = list(nucleus)
-        # iterative augmentation
-        remaining = [c for c in candidate_ids if c not in team]
-        while len(team) < k and remaining:
-            best_candidate = None
-            best_utility = -1e9
-            best_metrics = None
+    profiles = skill_profiles(levels)
+    return [_run_mode(mode, nucleus, candidate_ids, hard.get('skills',[]), k, G, levels, profiles, members_info) for mode in modes]
+
+# Utilidad por modo: pesos sobre (S_skill, S_exp, Cohesion, SPoF_risk) + término constante
+#   balance:    0.5*S_skill + 0.2*S_exp + 0.35*Cohesion - 0.15*SPoF
+#   cohesion:   0.2*S_skill + 0.7*Cohesion + 0.1*(1 - SPoF)
+#   redundancy: 0.5*S_skill + 0.1*S_exp + 0.4*(1 - SPoF)
+METRIC_KEYS = ('S_skill', 'S_exp', 'Cohesion', 'SPoF_risk')
+MODE_WEIGHTS = {
+    'balance':    ((0.5, 0.2, 0.35, -0.15), 0.0),
+    'cohesion':   ((0.2, 0.0, 0.7, -0.1), 0.1),
+    'redundancy': ((0.5, 0.1, 0.0, -0.4), 0.4),
+}
+
+def mode_utility(metrics: Dict[str, float], mode: str) -> float:
+    weights, bias = MODE_WEIGHTS[mode]
+    return bias + sum(w * metrics[key] for key, w in zip(METRIC_KEYS, weights))
+
+# Greedy + búsqueda local para un modo; devuelve el dossier
+def _run_mode(mode, nucleus, candidate_ids, skills, k, G, levels, profiles, members_info) -> dict:
+    state = TeamState(skills, levels, G, profiles)
+    for eid in nucleus:
+        state.add(eid)
+    team = state.members
+    # métricas del equipo actual: se arrastran desde el último cambio aceptado
+    current_metrics = None
+    # iterative augmentation
+    picked = set(team)
+    remaining = [c for c in candidate_ids if c not in picked]
+    while len(team) < k and remaining:
+        best_candidate = None
+        best_utility = -1e9
+        best_metrics = None
+        for cand in remaining:
+            metrics = state.metrics_with(add=cand)
+            utility = mode_utility(metrics, mode)
+            if utility > best_utility:
+                best_utility = utility
+                best_candidate = cand
+                best_metrics = metrics
+        if best_candidate is None:
+            break
+        state.add(best_candidate)
+        remaining.remove(best_candidate)
+        current_metrics = best_metrics
+    if current_metrics is None:
+        current_metrics = state.metrics()
+
+    # local search: intentar swaps que mejoren utilidad
+    current_utility = mode_utility(current_metrics, mode)
+    improved = True
+    iter_count = 0
+    while improved and iter_count < 10:
+        improved = False
+        for out_emp in list(team):
             for cand in remaining:
-                candidate_team = team + [cand]
-                metrics = compute_team_metrics(candidate_team, hard.get('skills',[]), G)
-                # utility: depende del mode
-                if mode == 'balance':
-                    # combine skill coverage, cohesion, and penalize spof
-                    utility = metrics['S_skill']*0.5 + metrics['Cohesion']*0.35 - metrics['SPoF_risk']*0.15 + metrics['S_exp']*0.2
-                elif mode == 'cohesion':
-                    utility = metrics['Cohesion']*0.7 + metrics['S_skill']*0.2 + (1-metrics['SPoF_risk'])*0.1
-                elif mode == 'redundancy':
-                    utility = metrics['S_skill']*0.5 + (1-metrics['SPoF_risk'])*0.4 + metrics['S_exp']*0.1
-                if utility > best_utility:
-                    best_utility = utility
-                    best_candidate = cand
-                    best_metrics = metrics
-            if best_candidate is None:
-                break
-            team.append(best_candidate)
-            remaining.remove(best_candidate)
-
-        # local search: intentar swaps que mejoren utilidad
-        improved = True
-        iter_count = 0
-        while improved and iter_count < 10:
-            improved = False
-            current_metrics = compute_team_metrics(team, hard.get('skills',[]), G)
-            current_utility = (current_metrics['S_skill']*0.5 + current_metrics['Cohesion']*0.35 - current_metrics['SPoF_risk']*0.15 + current_metrics['S_exp']*0.2)
-            for out_idx, out_emp in enumerate(team):
-                for cand in remaining:
-                    new_team = team.copy()
-                    new_team[out_idx] = cand
-                    new_metrics = compute_team_metrics(new_team, hard.get('skills',[]), G)
-                    new_utility = (new_metrics['S_skill']*0.5 + new_metrics['Cohesion']*0.35 - new_metrics['SPoF_risk']*0.15 + new_metrics['S_exp']*0.2)
-                    if new_utility > current_utility + 1e-6:
-                        team = new_team
-                        remaining.remove(cand)
-                        remaining.append(out_emp)
-                        improved = True
-                        break
-                if improved:
+                new_metrics = state.metrics_with(add=cand, drop=out_emp)
+                new_utility = mode_utility(new_metrics, mode)
+                if new_utility > current_utility + 1e-6:
+                    state.swap(out_emp, cand)
+                    current_metrics, current_utility = new_metrics, new_utility
+                    remaining.remove(cand)
+                    remaining.append(out_emp)
+                    improved = True
                     break
-            iter_count += 1
-
-        # Build dossier (explainable)
-        dossier = {
-            'mode': mode,
-            # replace member ids with basic objects (id, nombre, rol) for UI friendliness
-            'members': [],
-            'metrics': compute_team_metrics(team, hard.get('skills',[]), G),
-            'justificaciones': []
-        }
-        # fetch basic info for each member id
-        with driver.session() as s:
-            for m in team:
-                q = """
-                MATCH (e:Empleado {id:$eid})
-                RETURN e.id as id, e.nombre as nombre, e.rol as rol
-                """
-                res = s.run(q, eid=m)
-                rec = res.single()
-                if rec:
-                    dossier['members'].append({'id': rec['id'], 'nombre': rec.get('nombre') or rec.get('id'), 'rol': rec.get('rol')})
-                else:
-                    dossier['members'].append({'id': m, 'nombre': m, 'rol': None})
-        # justificaciones: for each member, fetch top evidences for required skills
-        for m in team:
-            # obtener skills y evidencias
-            skill_info = get_employee_skill_levels(m, hard.get('skills',[]))
-            # build structured justifications per skill with top evidences
-            skill_justs = []
-            for s,info in skill_info.items():
-                if info.get('nivel',0) >= 1:
-                    evids = info.get('evidencias', []) or []
-                    # sort evidences by date desc when date present
-                    try:
-                        evids_sorted = sorted(evids, key=lambda x: x.get('date') or '', reverse=True)
-                    except Exception:
-                        evids_sorted = evids
-                    top_evid = evids_sorted[:3]
-                    skill_justs.append({'skill': s, 'nivel': info.get('nivel',0.0), 'evidencias': top_evid})
-            dossier['justificaciones'].append({'id': m, 'skills': skill_justs})
-        proposals.append(dossier)
+            if improved:
+                break
+        iter_count += 1
 
-    return proposals
+    # Build dossier (explainable)
+    dossier = {
+        'mode': mode,
+        # replace member ids with basic objects (id, nombre, rol) for UI friendliness
+        'members': [],
+        'metrics': current_metrics,
+        'justificaciones': []
+    }
+    # basic info for each member id (prefetched with the candidates)
+    for m in team:
+        dossier['members'].append(dict(members_info.get(m) or {'id': m, 'nombre': m, 'rol': None}))
+    # justificaciones: for each member, fetch top evidences for required skills
+    for m in team:
+        # obtener skills y evidencias
+        skill_info = levels[m]
+        # build structured justifications per skill with top evidences
+        skill_justs = []
+        for s,info in skill_info.items():
+            if info.get('nivel',0) >= 1:
+                # evidencias ya llegan ordenadas por fecha desc y limitadas a EVIDENCE_LIMIT
+                top_evid = info.get('evidencias', []) or []
+                skill_justs.append({'skill': s, 'nivel': info.get('nivel',0.0), 'evidencias': top_evid})
+        dossier['justificaciones'].append({'id': m, 'skills': skill_justs})
+    return dossier
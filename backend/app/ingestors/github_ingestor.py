@@ -1,11 +1,18 @@
 import os
 import requests
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 from ..db import get_driver
 from dateutil import parser
 from ..scoring import recompute_skill_levels_for_employees
 
 GITHUB_TOKEN = os.getenv('GITHUB_TOKEN', '')
+GITHUB_MAX_WORKERS = int(os.getenv('GITHUB_MAX_WORKERS', '8'))
+
+# Sesión HTTP compartida: reutiliza conexiones TCP/TLS a api.github.com entre commits
+_http = requests.Session()
+_http.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=GITHUB_MAX_WORKERS))
 
 # Minimal extractor: fetch recent commits by author in a repo, map file extensions -> skills
 EXTENSION_SKILL_MAP = {
@@ -30,20 +37,64 @@ def map_files_to_skills(files):
     return list(skills)
 
 
-def ingest_commit(repo_fullname, commit_sha, author_login):
+def fetch_commit(repo_fullname, commit_sha):
     headers = {'Authorization': f'token {GITHUB_TOKEN}'} if GITHUB_TOKEN else {}
     url = f'https://api.github.com/repos/{repo_fullname}/commits/{commit_sha}'
-    r = requests.get(url, headers=headers)
+    r = _http.get(url, headers=headers)
     r.raise_for_status()
-    data = r.json()
+    return r.json()
+
+
+# Un solo UNWIND por lote: Empleado/Skill/Evidence y relaciones en una transacción de escritura
+_Q_INGEST_EVIDENCE = '''
+UNWIND $rows AS row
+MERGE (e:Empleado {id:row.eid})
+MERGE (s:Skill {name:row.skill})
+MERGE (ev:Evidence {uid:row.uid})
+SET ev.url = row.url, ev.date = row.date, ev.actor = row.actor, ev.type = row.type, ev.source = row.source, ev.raw = row.raw
+MERGE (e)-[he:HAS_EVIDENCE]->(ev)
+MERGE (ev)-[ab:ABOUT]->(s)
+// keep compatibility: ensure the old relation exists and update ultimaDemostracion
+MERGE (e)-[r:DEMUESTRA_COMPETENCIA]->(s)
+SET r.ultimaDemostracion = CASE WHEN row.date IS NOT NULL THEN date(row.date) ELSE r.ultimaDemostracion END
+'''
+INGEST_BATCH_SIZE = 500
+
+
+def ingest_commits(repo_fullname, commits):
+    # commits: [(sha, author_login)]; las descargas van en paralelo sobre la sesión compartida.
+    # Un commit que falla se registra y se omite sin perder los demás; devuelve los sha fallidos
+    commits = list(commits)
+    datas, failed = {}, []
+    with ThreadPoolExecutor(max_workers=GITHUB_MAX_WORKERS) as ex:
+        futures = {ex.submit(fetch_commit, repo_fullname, sha): sha for sha, _ in commits}
+        for f in as_completed(futures):
+            sha = futures[f]
+            try:
+                datas[sha] = f.result()
+            except Exception as e:
+                print('warning: fetch_commit failed for', repo_fullname, sha, e)
+                failed.append(sha)
+    rows = []
+    for sha, author_login in commits:
+        if sha in datas:
+            rows.extend(commit_evidence_rows(datas[sha], sha, author_login))
+    store_evidence_rows(rows)
+    return failed
+
 
+def ingest_commit(repo_fullname, commit_sha, author_login):
+    store_evidence_rows(commit_evidence_rows(fetch_commit(repo_fullname, commit_sha), commit_sha, author_login))
+
+
+def commit_evidence_rows(data, commit_sha, author_login):
+    # una fila por skill tocado en el commit (todas apuntan al mismo Evidence uid)
     files = data.get('files', [])
     skills = map_files_to_skills(files)
     commit_url = data.get('html_url')
     date = data.get('commit', {}).get('committer', {}).get('date')
 
     # Insert evidence rows into Neo4j as objects (url, date, actor, type, id)
-    driver = get_driver()
     evidence_obj = {
         'url': commit_url,
         'date': (date[:10] if date else None),
@@ -53,28 +104,27 @@ def ingest_commit(repo_fullname, commit_sha, author_login):
         'id': commit_sha
     }
     evidence_json = json.dumps(evidence_obj)
+    rows = []
+    for sk in skills:
+        uid = f"{evidence_obj['source']}:{evidence_obj['id']}" if evidence_obj.get('id') else f"{evidence_obj['source']}:{author_login}:{sk}:{evidence_obj['url']}"
+        rows.append({'uid': uid, 'url': evidence_obj['url'], 'date': evidence_obj['date'], 'actor': evidence_obj['actor'],
+                     'type': evidence_obj['type'], 'source': evidence_obj['source'], 'raw': evidence_json,
+                     'eid': author_login, 'skill': sk})
+    return rows
+
+
+def store_evidence_rows(rows):
+    if not rows:
+        return
+    driver = get_driver()
     with driver.session() as s:
-        for sk in skills:
-            # ensure Employee and Skill exist
-            s.run("MERGE (e:Empleado {id:$eid}) MERGE (s:Skill {name:$skill})", eid=author_login, skill=sk)
-            # create or update Evidence node and relationships
-            cy = '''
-            MERGE (ev:Evidence {uid:$uid})
-            SET ev.url = $url, ev.date = $date, ev.actor = $actor, ev.type = $type, ev.source = $source, ev.raw = $raw
-            WITH ev
-            MATCH (e:Empleado {id:$eid}), (s:Skill {name:$skill})
-            MERGE (e)-[he:HAS_EVIDENCE]->(ev)
-            MERGE (ev)-[ab:ABOUT]->(s)
-            // keep compatibility: ensure the old relation exists and update ultimaDemostracion
-            MERGE (e)-[r:DEMUESTRA_COMPETENCIA]->(s)
-            SET r.ultimaDemostracion = CASE WHEN $date IS NOT NULL THEN date($date) ELSE r.ultimaDemostracion END
-            RETURN ev
-            '''
-            uid = f"{evidence_obj['source']}:{evidence_obj['id']}" if evidence_obj.get('id') else f"{evidence_obj['source']}:{author_login}:{sk}:{evidence_obj['url']}"
-            s.run(cy, uid=uid, url=evidence_obj['url'], date=evidence_obj['date'], actor=evidence_obj['actor'], type=evidence_obj['type'], source=evidence_obj['source'], raw=evidence_json, eid=author_login, skill=sk)
-        # after processing all skills, recompute levels for the affected employee
-        try:
-            recompute_skill_levels_for_employees(get_driver(), [author_login])
-        except Exception as e:
-            # do not fail ingestion on recompute error
-            print('warning: recompute_skill_levels_for_employees failed for', author_login, e)
+        for i in range(0, len(rows), INGEST_BATCH_SIZE):
+            batch = rows[i:i + INGEST_BATCH_SIZE]
+            s.execute_write(lambda tx: tx.run(_Q_INGEST_EVIDENCE, rows=batch).consume())
+    # after processing all rows, recompute levels for the affected employees
+    eids = sorted({r['eid'] for r in rows})
+    try:
+        recompute_skill_levels_for_employees(driver, eids)
+    except Exception as e:
+        # do not fail ingestion on recompute error
+        print('warning: recompute_skill_levels_for_employees failed for', eids, e)
@@ -1,12 +1,24 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from .db import driver
-from .schemas import IngestEvidence, TeamRequest
+from neo4j import RoutingControl
+from .db import driver, ensure_indexes
+from .cache import invalidate
+from .schemas import IngestEvidence, TeamRequest, TeamProposals, EmployeeList
 from .ingestors.github_ingestor import ingest_commit
 from .guardian import propose_teams, filter_candidates
-from .scoring import recompute_all_skill_levels, recompute_skill_levels_for_employees
+from .scoring import recompute_all_skill_levels, recompute_skill_levels_for_employees, SET_LEVEL_CYPHER
 
-app = FastAPI(title="Project Chimera API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # crear índices una vez al arrancar; no bloquear el arranque si Neo4j no responde
+    try:
+        ensure_indexes()
+    except Exception as e:
+        print('warning: ensure_indexes failed', e)
+    yield
+
+app = FastAPI(title="Project Chimera API", lifespan=lifespan)
 
 # Allow frontend dev server to call the API (adjust origins for production)
 app.add_middleware(
@@ -18,68 +30,63 @@ app.add_middleware(
 )
 
 @app.post("/ingest/evidence")
-async def ingest_evidence(e: IngestEvidence):
+def ingest_evidence(e: IngestEvidence):
     # crea/actualiza nodo Skill y relación DEMUESTRA_COMPETENCIA con evidence
-    with driver.session() as session:
-        cypher = """
-        MERGE (emp:Empleado {id:$eid})
-        MERGE (sk:Skill {name:$skill})
-        MERGE (emp)-[r:DEMUESTRA_COMPETENCIA]->(sk)
-        ON CREATE SET r.evidencias = [], r.nivel=0.0, r.ultimaDemostracion = date($date)
-        WITH r
-        CALL {
-          WITH r
-          SET r.evidencias = coalesce(r.evidencias, []) + [$url]
-          SET r.ultimaDemostracion = date($date)
-          RETURN r
-        }
-        RETURN r
-        """
-        session.run(cypher, eid=e.empleado_id, skill=e.skill, url=e.evidence_url, date=e.date or "2025-01-01")
+    # nivel calculado en la misma escritura (evidence nodes si existen, si no r.evidencias)
+    cypher = """
+    MERGE (emp:Empleado {id:$eid})
+    MERGE (sk:Skill {name:$skill})
+    MERGE (emp)-[r:DEMUESTRA_COMPETENCIA]->(sk)
+    ON CREATE SET r.evidencias = [], r.nivel=0.0
+    SET r.evidencias = coalesce(r.evidencias, []) + [$url],
+        r.ultimaDemostracion = date($date)
+    WITH emp, sk, r
+    OPTIONAL MATCH (emp)-[:HAS_EVIDENCE]->(ev:Evidence)-[:ABOUT]->(sk)
+    WITH r, count(ev) AS n_ev
+    WITH r, CASE WHEN n_ev > 0 THEN n_ev ELSE size(r.evidencias) END AS n,
+         duration.inDays(r.ultimaDemostracion, date()).days AS days
+    """ + SET_LEVEL_CYPHER
+    # execute_query: transacción gestionada (con reintentos) sin abrir sesión a mano
+    driver.execute_query(cypher, eid=e.empleado_id, skill=e.skill, url=e.evidence_url, date=e.date or "2025-01-01")
+    invalidate(e.empleado_id)
     return {"ok": True}
 
-@app.post("/team/propose")
-async def team_propose(req: TeamRequest):
-    # Filtra candidatos por hard requirements
-    payload = req.dict()
-    hard = payload.get('requisitos_hard', {})
+def _refresh_candidate_levels(hard: dict):
+    # Recompute skill levels only for the candidates involved and not yet recomputed today
     try:
-        candidates_raw = filter_candidates(hard)
-        candidate_ids = [c['id'] for c in candidates_raw]
-    except Exception:
-        candidate_ids = []
-
-    # Recompute skill levels only for the candidates involved (on-demand, efficient)
-    if candidate_ids:
-        try:
-            recompute_skill_levels_for_employees(driver, candidate_ids)
-        except Exception as e:
-            # don't fail the request; log and continue
-            print('warning: recompute skill levels failed', e)
+        candidate_ids = [c['id'] for c in filter_candidates(hard)]
+        if candidate_ids:
+            recompute_skill_levels_for_employees(driver, candidate_ids, stale_only=True)
+    except Exception as e:
+        # background job: log and continue
+        print('warning: recompute skill levels failed', e)
 
-    # call the guardian algorithm
-    proposals = propose_teams(payload)
+# response_model: FastAPI serializa con Pydantic directo a bytes JSON (sin jsonable_encoder)
+@app.post("/team/propose", response_model=TeamProposals)
+def team_propose(req: TeamRequest, background_tasks: BackgroundTasks):
+    # call the guardian algorithm with the last known r.nivel
+    proposals = propose_teams(req.model_dump())
+    # refresco de niveles fuera del camino crítico (después de enviar la respuesta)
+    background_tasks.add_task(_refresh_candidate_levels, req.requisitos_hard or {})
     return {"proposals": proposals}
 
 
-@app.get("/employees")
-async def list_employees():
+@app.get("/employees", response_model=EmployeeList)
+def list_employees():
     # devuelve lista simple de empleados para visualización en frontend
+    # Neo4j arma la lista completa: un solo valor en la respuesta Bolt
     q = """
     MATCH (e:Empleado)
-    RETURN e.id as id, e.nombre as nombre, e.rol as rol
-    ORDER BY e.id
+    WITH e ORDER BY e.id
+    RETURN collect({id:e.id, nombre:e.nombre, rol:e.rol}) AS employees
     """
-    out = []
-    with driver.session() as s:
-        res = s.run(q)
-        for r in res:
-            out.append({ 'id': r['id'], 'nombre': r.get('nombre'), 'rol': r.get('rol') })
+    records, _, _ = driver.execute_query(q, routing_=RoutingControl.READ)
+    out = records[0]['employees']
     return { 'employees': out }
 
 
 @app.post("/admin/recompute-skills")
-async def admin_recompute_skills():
+def admin_recompute_skills():
     """Recompute skill levels for all DEMUESTRA_COMPETENCIA relationships (admin endpoint)."""
     res = recompute_all_skill_levels(driver)
     return { 'ok': True, 'result': res }
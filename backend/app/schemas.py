@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional, Dict
+from typing import Any, List, Optional, Dict
 
 
 class IngestEvidence(BaseModel):
@@ -14,4 +14,18 @@ class TeamRequest(BaseModel):
     requisitos_hard: Dict
     perfil_mision: str
     k: int
-    preferences: Optional[Dict] = {}
\ No newline at end of file
+    preferences: Optional[Dict] = {}
+
+class Employee(BaseModel):
+    # se devuelve tal cual está en Neo4j: un id nulo o no-string no debe tumbar /employees
+    id: Optional[Any] = None
+    nombre: Optional[Any] = None
+    rol: Optional[Any] = None
+
+
+class EmployeeList(BaseModel):
+    employees: List[Employee]
+
+
+class TeamProposals(BaseModel):
+    proposals: List[Dict[str, Any]]
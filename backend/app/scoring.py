@@ -2,6 +2,9 @@ from datetime import date, datetime
 import math
 from typing import List, Optional, Union
 import json
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from .cache import invalidate
 
 
 def _parse_evidence_date(ev) -> Optional[str]:
@@ -11,43 +14,42 @@ def _parse_evidence_date(ev) -> Optional[str]:
     """
     if not ev:
         return None
-    # string legacy format: no date
-    if isinstance(ev, str):
-        # legacy: plain URL string, or JSON-serialized object
-        s = ev.strip()
-        if s.startswith('{') and s.endswith('}'):
-            try:
-                obj = json.loads(s)
-                # recursively try dict branch
-                return _parse_evidence_date(obj)
-            except Exception:
-                return None
-        return None
+    # Evidence nodes llegan como dict: camino rápido
     if isinstance(ev, dict):
-        for k in ('date', 'fecha', 'created_at', 'when'):
-            if k in ev and ev[k]:
-                # accept already ISO date or full datetime
-                v = str(ev[k])
-                try:
-                    # if contains 'T' assume datetime
-                    if 'T' in v:
-                        return v.split('T')[0]
-                    return v[:10]
-                except Exception:
-                    continue
+        return _parse_evidence_date_dict(ev)
+    if isinstance(ev, str):
+        return _parse_evidence_date_legacy_string(ev)
+    return None
+
+_DATE_KEYS = ('date', 'fecha', 'created_at', 'when')
+
+def _parse_evidence_date_dict(ev: dict) -> Optional[str]:
+    raw = next((v for v in map(ev.get, _DATE_KEYS) if v), None)
+    # ISO date or full datetime: the date is the first 10 chars either way
+    return str(raw)[:10] if raw else None
+
+def _parse_evidence_date_legacy_string(ev: str) -> Optional[str]:
+    # legacy: plain URL string (no date), or JSON-serialized object
+    s = ev.strip()
+    if s[:1] == '{':
+        try:
+            obj = json.loads(s)
+        except Exception:
+            return None
+        return _parse_evidence_date_dict(obj) if isinstance(obj, dict) else None
     return None
 
-def _days_since(d: Optional[str]) -> Optional[int]:
+def _days_since(d: Optional[str], today: Optional[date] = None) -> Optional[int]:
     if not d:
         return None
     try:
         # Neo4j date may be returned as string 'YYYY-MM-DD'
         dt = date.fromisoformat(str(d))
-        return (date.today() - dt).days
+        return ((today or date.today()) - dt).days
     except Exception:
         return None
 
-def compute_skill_level_from_relation(evidences: Optional[List[Union[str, dict]]], ultima: Optional[str]) -> float:
+def compute_skill_level_from_relation(evidences: Optional[List[Union[str, dict]]], ultima: Optional[str], today: Optional[date] = None) -> float:
     """
     Compute a level in range [1.0, 5.0] from evidences list and last demonstration date.
 
@@ -57,11 +59,16 @@ def compute_skill_level_from_relation(evidences: Optional[List[Union[str, dict]]
       - combine = 0.6*freq_score + 0.4*recency_score
       - level = 1 + 4 * combine
 
+    `today` defaults to date.today(); batch callers pass it once.
     Returns a float rounded to 2 decimals.
     """
+    return _compute_level_numeric(*_evidence_stats(evidences, ultima, today))
+
+
+def _evidence_stats(evidences, ultima, today=None):
+    # (n evidencias, días desde la última demostración o None)
     # Support evidences as list of strings (legacy) or list of objects with dates
     n = len(evidences) if evidences else 0
-    freq_score = math.log(1 + n) / math.log(1 + 10) if n > 0 else 0.0
 
     # If ultima not provided, try to infer latest date from evidence objects
     inferred_ultima = None
@@ -74,7 +81,15 @@ def compute_skill_level_from_relation(evidences: Optional[List[Union[str, dict]]
         if dates:
             inferred_ultima = max(dates)
 
-    days = _days_since(ultima or inferred_ultima)
+    return n, _days_since(ultima or inferred_ultima, today)
+
+
+_LOG11 = math.log(1 + 10)
+
+
+def _compute_level_numeric(n: int, days: Optional[int]) -> float:
+    """Numeric core of compute_skill_level_from_relation: n evidences, days since last one (None = unknown)."""
+    freq_score = math.log(1 + n) / _LOG11 if n > 0 else 0.0
     if days is None:
         recency_score = 0.2  # conservative when unknown
     else:
@@ -87,53 +102,92 @@ def compute_skill_level_from_relation(evidences: Optional[List[Union[str, dict]]
     return round(level, 2)
 
 
+# Misma fórmula que _compute_level_numeric en Cypher, para fijar r.nivel al escribir evidencia.
+# Espera `r`, `n` (nº de evidencias) y `days` (días desde la última, o null) en scope.
+SET_LEVEL_CYPHER = """
+WITH r, CASE WHEN n > 0 THEN log(1.0 + n) / log(11.0) ELSE 0.0 END AS freq_score,
+     CASE WHEN days IS NULL THEN 0.2 WHEN days >= 365 THEN 0.0 ELSE 1.0 - days / 365.0 END AS recency_score
+WITH r, 1.0 + 4.0 * (0.6 * freq_score + 0.4 * recency_score) AS level
+SET r.nivel = round(CASE WHEN level < 1.0 THEN 1.0 WHEN level > 5.0 THEN 5.0 ELSE level END, 2),
+    r._nivel_computed_at = date()
+"""
+
+
+def compute_levels_numeric(ns, days) -> np.ndarray:
+    """Vectorized _compute_level_numeric over arrays of evidence counts and days (NaN = unknown)."""
+    ns = np.asarray(ns, dtype=float)
+    days = np.asarray(days, dtype=float)
+    freq_score = np.log1p(ns) / _LOG11
+    recency_score = np.where(np.isnan(days), 0.2, np.maximum(0.0, 1.0 - days / 365.0))
+    level = 1.0 + 4.0 * (0.6 * freq_score + 0.4 * recency_score)
+    return np.clip(level, 1.0, 5.0).round(2)
+
+
+# Escritura de niveles en lote: un UNWIND por UPDATE_BATCH_SIZE relaciones
+_Q_UPDATE_LEVELS = """
+UNWIND $rows AS row
+MATCH (e:Empleado {id:row.eid})-[r:DEMUESTRA_COMPETENCIA]->(s:Skill {name:row.skill})
+SET r.nivel = row.nivel, r._nivel_computed_at = date()
+"""
+UPDATE_BATCH_SIZE = 1000
+# recompute por empleados: lotes de RECOMPUTE_CHUNK_SIZE en hasta RECOMPUTE_MAX_WORKERS transacciones paralelas
+RECOMPUTE_CHUNK_SIZE = 100
+RECOMPUTE_MAX_WORKERS = 8
+
+
+def _write_levels(session, rows):
+    for i in range(0, len(rows), UPDATE_BATCH_SIZE):
+        session.run(_Q_UPDATE_LEVELS, rows=rows[i:i + UPDATE_BATCH_SIZE]).consume()
+
+
+def _recompute_levels(runner, cypher_read, **params):
+    # runner: sesión o transacción (mismo .run); lee, calcula y escribe en lote
+    keys, ns, days = [], [], []
+    today = date.today()  # una lectura del reloj por recompute
+    for r in runner.run(cypher_read, **params):
+        # prefer nodes (count/max agregados en Cypher); if none, use legacy list
+        if r['n_ev']:
+            last = r['last_ev_date']
+            n, d = r['n_ev'], _days_since(r['ultima'] or (str(last)[:10] if last else None), today)
+        else:
+            # legacy entries may be URL strings or JSON strings
+            n, d = _evidence_stats(r['evidencias_legacy'] or [], r['ultima'], today)
+        keys.append((r['eid'], r['skill']))
+        ns.append(n)
+        days.append(np.nan if d is None else d)
+    # todos los niveles en una sola expresión NumPy
+    levels = compute_levels_numeric(ns, days)
+    rows = [{'eid': eid, 'skill': skill, 'nivel': float(nivel)} for (eid, skill), nivel in zip(keys, levels)]
+    _write_levels(runner, rows)
+    return rows
+
+
 def recompute_all_skill_levels(driver):
     """
     Iterate over all DEMUESTRA_COMPETENCIA relationships and recompute `r.nivel` based on evidences and ultimaDemostracion.
     Writes the value back into the relationship.
     """
-    # Prefer evidence nodes when present; fall back to relationship property r.evidencias (legacy)
+    # Prefer evidence nodes when present (only count + latest date travel); fall back to r.evidencias (legacy)
     cypher_read = """
     MATCH (e:Empleado)-[r:DEMUESTRA_COMPETENCIA]->(s:Skill)
     OPTIONAL MATCH (e)-[:HAS_EVIDENCE]->(ev:Evidence)-[:ABOUT]->(s)
-    WITH e, r, s, collect(CASE WHEN ev IS NULL THEN NULL ELSE {url:ev.url, date:ev.date, actor:ev.actor, source:ev.source, id:ev.uid, raw:ev.raw} END) AS evs
-    RETURN e.id AS eid, s.name AS skill, evs AS evidencias_nodes, r.evidencias AS evidencias_legacy, r.ultimaDemostracion AS ultima
-    """
-
-    update_q = """
-    MATCH (e:Empleado {id:$eid})-[r:DEMUESTRA_COMPETENCIA]->(s:Skill {name:$skill})
-    SET r.nivel = $nivel, r._nivel_computed_at = date()
-    RETURN r
+    WITH e, r, s, count(ev) AS n_ev, max(ev.date) AS last_ev_date
+    RETURN e.id AS eid, s.name AS skill, n_ev, last_ev_date,
+           CASE WHEN n_ev = 0 THEN r.evidencias ELSE NULL END AS evidencias_legacy, r.ultimaDemostracion AS ultima
     """
 
+    # grafo completo: lotes en auto-commit para no retener una transacción gigante
     with driver.session() as s:
-        res = s.run(cypher_read)
-        count = 0
-        for r in res:
-            eid = r['eid']
-            skill = r['skill']
-            evidencias_nodes = r.get('evidencias_nodes') or []
-            evidencias_legacy = r.get('evidencias_legacy') or []
-            # prefer nodes; if none, use legacy list
-            evidencias = []
-            if evidencias_nodes and any(e for e in evidencias_nodes if e is not None):
-                for ev in evidencias_nodes:
-                    if not ev:
-                        continue
-                    evidencias.append(ev)
-            else:
-                # legacy entries may be URL strings or JSON strings
-                evidencias = evidencias_legacy
-            ultima = r.get('ultima')
-            nivel = compute_skill_level_from_relation(evidencias, ultima)
-            s.run(update_q, eid=eid, skill=skill, nivel=nivel)
-            count += 1
-    return { 'updated': count }
-
-
-def recompute_skill_levels_for_employees(driver, employee_ids: List[str]):
+        rows = _recompute_levels(s, cypher_read)
+    invalidate()
+    return { 'updated': len(rows) }
+
+
+def recompute_skill_levels_for_employees(driver, employee_ids: List[str], stale_only: bool = False):
     """
     Recompute r.nivel only for DEMUESTRA_COMPETENCIA relationships where the employee is in employee_ids.
+    With stale_only, relationships already recomputed today (r._nivel_computed_at = date()) are skipped;
+    ingest paths reset that marker when they add evidence.
     """
     if not employee_ids:
         return { 'updated': 0 }
@@ -141,35 +195,27 @@ def recompute_skill_levels_for_employees(driver, employee_ids: List[str]):
     cypher_read = """
     UNWIND $ids AS eid
     MATCH (e:Empleado {id:eid})-[r:DEMUESTRA_COMPETENCIA]->(s:Skill)
+    WHERE NOT $stale_only OR r._nivel_computed_at IS NULL OR r._nivel_computed_at < date()
     OPTIONAL MATCH (e)-[:HAS_EVIDENCE]->(ev:Evidence)-[:ABOUT]->(s)
-    WITH e, r, s, collect(CASE WHEN ev IS NULL THEN NULL ELSE {url:ev.url, date:ev.date, actor:ev.actor, source:ev.source, id:ev.uid, raw:ev.raw} END) AS evs
-    RETURN e.id AS eid, s.name AS skill, evs AS evidencias_nodes, r.evidencias AS evidencias_legacy, r.ultimaDemostracion AS ultima
+    WITH e, r, s, count(ev) AS n_ev, max(ev.date) AS last_ev_date
+    RETURN e.id AS eid, s.name AS skill, n_ev, last_ev_date,
+           CASE WHEN n_ev = 0 THEN r.evidencias ELSE NULL END AS evidencias_legacy, r.ultimaDemostracion AS ultima
     """
 
-    update_q = """
-    MATCH (e:Empleado {id:$eid})-[r:DEMUESTRA_COMPETENCIA]->(s:Skill {name:$skill})
-    SET r.nivel = $nivel, r._nivel_computed_at = date()
-    RETURN r
-    """
+    def _chunk(ids):
+        # lectura + escritura en una sola transacción (reintentada por el driver); una sesión por hilo
+        with driver.session() as s:
+            return s.execute_write(_recompute_levels, cypher_read, ids=ids, stale_only=stale_only)
 
-    with driver.session() as s:
-        res = s.run(cypher_read, ids=employee_ids)
-        count = 0
-        for r in res:
-            eid = r['eid']
-            skill = r['skill']
-            evidencias_nodes = r.get('evidencias_nodes') or []
-            evidencias_legacy = r.get('evidencias_legacy') or []
-            evidencias = []
-            if evidencias_nodes and any(e for e in evidencias_nodes if e is not None):
-                for ev in evidencias_nodes:
-                    if not ev:
-                        continue
-                    evidencias.append(ev)
-            else:
-                evidencias = evidencias_legacy
-            ultima = r.get('ultima')
-            nivel = compute_skill_level_from_relation(evidencias, ultima)
-            s.run(update_q, eid=eid, skill=skill, nivel=nivel)
-            count += 1
-    return { 'updated': count }
+    employee_ids = list(employee_ids)
+    chunks = [employee_ids[i:i + RECOMPUTE_CHUNK_SIZE] for i in range(0, len(employee_ids), RECOMPUTE_CHUNK_SIZE)]
+    if len(chunks) == 1:
+        rows = _chunk(chunks[0])
+    else:
+        # lotes independientes en paralelo; acotado para no agotar el pool del driver
+        with ThreadPoolExecutor(max_workers=min(RECOMPUTE_MAX_WORKERS, len(chunks))) as ex:
+            rows = [row for part in ex.map(_chunk, chunks) for row in part]
+    # solo los empleados que cambiaron pierden sus entradas de cache
+    if rows:
+        invalidate(*{r['eid'] for r in rows})
+    return { 'updated': len(rows) }
@@ -0,0 +1,2 @@
+# pytest importa este conftest con el modo "prepend": backend/ queda en sys.path una vez por sesión,
+# así `from app...` funciona también ejecutando `pytest backend` desde la raíz del repo.
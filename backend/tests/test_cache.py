@@ -0,0 +1,19 @@
+from app.cache import cached, invalidate
+
+
+def test_cached_only_fetches_misses_and_invalidates():
+    calls = []
+
+    @cached(ttl=60, maxsize=100)
+    def fetch(eids, skills, session=None):
+        calls.append(list(eids))
+        return {eid: {'skills': list(skills)} for eid in eids}
+
+    assert fetch(['a', 'b'], ['x', 'y']) == {'a': {'skills': ['x', 'y']}, 'b': {'skills': ['x', 'y']}}
+    # mismo set de skills en otro orden: 'a' sale de cache
+    fetch(['a', 'c'], ['y', 'x'])
+    assert calls == [['a', 'b'], ['c']]
+
+    invalidate('a')
+    fetch(['a', 'b'], ['x', 'y'])
+    assert calls[-1] == ['a']
@@ -0,0 +1,34 @@
+import requests
+from app.ingestors import github_ingestor
+
+
+class _Resp:
+    def __init__(self, sha):
+        self.sha = sha
+
+    def raise_for_status(self):
+        if self.sha == 'bad':
+            raise requests.HTTPError('404 Not Found')
+
+    def json(self):
+        return {'html_url': f'https://github.com/o/r/commit/{self.sha}',
+                'commit': {'committer': {'date': '2026-01-02T10:00:00Z'}},
+                'files': [{'filename': 'app/main.py'}]}
+
+
+class _Http:
+    def get(self, url, headers=None):
+        return _Resp(url.rsplit('/', 1)[-1])
+
+
+def test_ingest_commits_skips_failed_fetches(monkeypatch):
+    stored = []
+    monkeypatch.setattr(github_ingestor, '_http', _Http())
+    monkeypatch.setattr(github_ingestor, 'store_evidence_rows', stored.extend)
+
+    failed = github_ingestor.ingest_commits('o/r', [('s1', 'ana'), ('bad', 'bo'), ('s2', 'di')])
+
+    assert failed == ['bad']
+    # los commits descargados se guardan igual, en el orden pedido
+    assert [(r['uid'], r['eid'], r['skill']) for r in stored] == [('github:s1', 'ana', 'Python'), ('github:s2', 'di', 'Python')]
+    assert stored[0]['date'] == '2026-01-02'
@@ -0,0 +1,80 @@
+from datetime import date, timedelta
+import networkx as nx
+from app.guardian import TeamState, compute_edge_strength, compute_edge_strengths, mode_utility, skill_experts, find_linchpins
+
+
+def _fixture():
+    skills = ['python', 'git']
+    levels = {
+        'a': {'python': {'nivel': 4.0}, 'git': {'nivel': 2.0}},
+        'b': {'python': {'nivel': 3.5}},
+        'c': {'git': {'nivel': 3.0}},
+    }
+    G = nx.Graph()
+    G.add_nodes_from(['a', 'b', 'c'])
+    G.add_edge('a', 'b', weight=5.0)
+    G.add_edge('b', 'c', weight=2.0)
+    return skills, levels, G
+
+
+def _state(members):
+    skills, levels, G = _fixture()
+    st = TeamState(skills, levels, G)
+    for m in members:
+        st.add(m)
+    return st
+
+
+def test_team_state_metrics():
+    m = _state(['a', 'b']).metrics()
+    assert m['S_skill'] == 1.0
+    assert abs(m['S_exp'] - (4.0 + 2.0 + 3.5) / 3 / 5.0) < 1e-9
+    assert abs(m['Cohesion'] - 5.0 / 10.0) < 1e-9
+    # python tiene dos expertos, git ninguno
+    assert m['SPoF_risk'] == 0.0
+
+
+def test_team_state_metrics_with_matches_rebuild():
+    st = _state(['a', 'b'])
+    assert st.metrics_with(add='c') == _state(['a', 'b', 'c']).metrics()
+    assert st.metrics_with(add='c', drop='a') == _state(['c', 'b']).metrics()
+    # evaluar no muta el estado
+    assert st.members == ['a', 'b']
+
+
+def test_team_state_swap_keeps_position():
+    st = _state(['a', 'b'])
+    st.swap('a', 'c')
+    assert st.members == ['c', 'b']
+    assert st.metrics() == _state(['c', 'b']).metrics()
+
+
+def test_compute_edge_strengths_matches_scalar():
+    old = (date.today() - timedelta(days=200)).isoformat()
+    recs = [
+        {'pos': 5, 'conf': 0, 'freq': 10, 'rec': 3},
+        {'pos': 3, 'conf': 1, 'freq': 7, 'rec': old},
+        {'pos': 1, 'conf': 2, 'freq': None, 'rec': None},
+        {'pos': 2, 'conf': 0, 'freq': 2, 'rec': 'not-a-date'},
+    ]
+    vec = compute_edge_strengths(recs)
+    for r, w in zip(recs, vec):
+        assert abs(compute_edge_strength(r) - w) < 1e-9
+
+
+def test_mode_utility_matches_weighting():
+    m = {'S_skill': 0.8, 'S_exp': 0.6, 'Cohesion': 0.3, 'SPoF_risk': 0.5}
+    assert abs(mode_utility(m, 'balance') - (0.8*0.5 + 0.3*0.35 - 0.5*0.15 + 0.6*0.2)) < 1e-9
+    assert abs(mode_utility(m, 'cohesion') - (0.3*0.7 + 0.8*0.2 + (1-0.5)*0.1)) < 1e-9
+    assert abs(mode_utility(m, 'redundancy') - (0.8*0.5 + (1-0.5)*0.4 + 0.6*0.1)) < 1e-9
+
+
+def test_skill_experts_uses_expert_threshold():
+    _, levels, _ = _fixture()
+    assert skill_experts(levels) == {'python': {'a', 'b'}, 'git': {'c'}}
+
+
+def test_find_linchpins_prefers_coverage_then_connectivity():
+    skills, levels, G = _fixture()
+    # a y b cubren python (1 skill experto); b tiene más peso de colaboración
+    assert find_linchpins(['a', 'b', 'c'], skills, G, top_k=2, levels=levels) == ['b', 'a']
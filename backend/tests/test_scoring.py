@@ -1,5 +1,5 @@
 import json
-from app.scoring import compute_skill_level_from_relation
+from app.scoring import compute_skill_level_from_relation, compute_levels_numeric, _compute_level_numeric
 
 
 def test_compute_skill_level_monotonic():
@@ -22,3 +22,10 @@ def test_compute_with_json_string_evidence_recent():
     l_recent = compute_skill_level_from_relation([recent], None)
     l_none = compute_skill_level_from_relation(["http://x"], None)
     assert l_recent >= l_none
+
+
+def test_compute_levels_numeric_matches_scalar():
+    cases = [(n, d) for n in (0, 1, 3, 10, 40) for d in (None, -5, 0, 30, 200, 365, 900)]
+    levels = compute_levels_numeric([n for n, _ in cases], [float('nan') if d is None else d for _, d in cases])
+    for (n, d), level in zip(cases, levels):
+        assert abs(_compute_level_numeric(n, d) - level) < 1e-9
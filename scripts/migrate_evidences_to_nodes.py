@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 """
 Script de migración:
+- Crea constraints de unicidad para Empleado.id, Skill.name y Evidence.uid en lugar de los índices
+  simples de la app (si hay datos duplicados se queda con el índice y lo avisa)
 - Lee relaciones (Empleado)-[r:DEMUESTRA_COMPETENCIA]->(Skill) y su propiedad r.evidencias
 - Para cada item en r.evidencias (string URL o JSON-string), crea un nodo :Evidence{uid, url, date, actor, type, source, raw}
 - Crea relaciones (Empleado)-[:HAS_EVIDENCE]->(Evidence)-[:ABOUT]->(Skill)
@@ -10,6 +12,8 @@ Script de migración:
 USO:
   Ejecutar desde el root del repo con las variables de entorno del compose disponibles (o usando las mismas credenciales):
     python scripts/migrate_evidences_to_nodes.py
+  El driver es el de backend/app/db.py; para migraciones grandes se puede subir el fetch/pool por entorno:
+    NEO4J_FETCH_SIZE=5000 NEO4J_POOL_SIZE=50 NEO4J_ACQUISITION_TIMEOUT=60 python scripts/migrate_evidences_to_nodes.py
 
 Nota: Hice el script de forma segura: si evidence ya existe (por uid) no la duplicará.
 
@@ -19,6 +23,12 @@ import os
 import sys
 from uuid import uuid4
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson
+except ImportError:  # opcional: sin orjson se usa json stdlib
+    orjson = None
 
 # Import the project's Neo4j driver helper
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'backend'))
@@ -31,8 +41,51 @@ except Exception as e:
     raise
 
 
+# filas por sentencia UNWIND / hilos de escritura
+BATCH_SIZE = 1000
+WRITE_WORKERS = max(1, int(os.getenv('MIGRATE_WORKERS', '4')))  # 0 o negativo -> 1 hilo
+
+
+# Constraints de unicidad para las claves que se MERGEan: (label, propiedad, índice simple de
+# app.db.INDEXES al que reemplaza). Neo4j no crea el constraint si ya hay un índice sobre la misma
+# propiedad, así que el índice solo se borra cuando falta el constraint y no hay valores duplicados.
+CONSTRAINTS = [
+    ('Empleado', 'id', 'empleado_id'),
+    ('Skill', 'name', 'skill_name'),
+    ('Evidence', 'uid', 'evidence_uid'),
+]
+
+
+def ensure_schema(driver):
+    # devuelve los índices (empleado_id, ...) cuya clave quedó con constraint de unicidad
+    unique = set()
+    with driver.session() as s:
+        existing = {(r['labels'][0], r['props'][0]) for r in s.run(
+            "SHOW CONSTRAINTS YIELD labelsOrTypes AS labels, properties AS props, type "
+            "WHERE type CONTAINS 'UNIQUENESS' AND size(props) = 1 RETURN labels, props")}
+        for label, prop, index_name in CONSTRAINTS:
+            if (label, prop) in existing:
+                unique.add(index_name)
+                continue
+            dups = s.run(f"MATCH (n:{label}) WHERE n.{prop} IS NOT NULL "
+                         f"WITH n.{prop} AS k, count(*) AS c WHERE c > 1 RETURN count(k) AS dups").single()['dups']
+            if dups:
+                print(f'WARNING: {dups} valores de {label}.{prop} repetidos; no creo el constraint de unicidad '
+                      f'y sigo con el índice {index_name} (esa clave puede seguir duplicándose)')
+                continue
+            s.run(f"DROP INDEX {index_name} IF EXISTS").consume()
+            try:
+                s.run(f"CREATE CONSTRAINT {index_name}_unique IF NOT EXISTS FOR (n:{label}) REQUIRE n.{prop} IS UNIQUE").consume()
+                unique.add(index_name)
+            except Exception as e:
+                print(f'WARNING: no pude crear el constraint de unicidad para {label}.{prop}; restauro el índice {index_name}:', e)
+                s.run(f"CREATE INDEX {index_name} IF NOT EXISTS FOR (n:{label}) ON (n.{prop})").consume()
+    return unique
+
+
 def parse_evidence_item(item):
-    """Devuelve un dict con keys: url, date, actor, type, source, id, raw
+    """Devuelve un dict con keys: url, date, actor, type, source, id, raw (raw siempre presente,
+    date ya normalizada a yyyy-mm-dd)
     item puede ser:
       - string simple (URL)
       - JSON string serializado
@@ -42,16 +95,19 @@ def parse_evidence_item(item):
         return None
     if isinstance(item, dict):
         base = dict(item)
-        base.setdefault('raw', json.dumps(item, ensure_ascii=False))
-        return base
+        # serializar solo si falta raw (setdefault evaluaba el dumps siempre)
+        if not base.get('raw'):
+            base['raw'] = _dumps(item)
+        return _normalize_date(base)
     if isinstance(item, str):
         s = item.strip()
-        # try parse json
-        if s.startswith('{') and s.endswith('}'):
+        # try parse json (un solo chequeo; si no es JSON válido cae a URL)
+        if s[:1] == '{':
             try:
-                obj = json.loads(s)
-                obj.setdefault('raw', s)
-                return obj
+                obj = _loads(s)
+                if not obj.get('raw'):
+                    obj['raw'] = s
+                return _normalize_date(obj)
             except Exception:
                 # fallthrough: treat as URL
                 pass
@@ -69,6 +125,23 @@ def parse_evidence_item(item):
     return { 'url': str(item), 'raw': str(item) }
 
 
+def _normalize_date(ev):
+    # normalize date to yyyy-mm-dd if possible (una vez, al parsear)
+    if ev.get('date'):
+        ev['date'] = str(ev['date'])[:10]
+    return ev
+
+
+# orjson acepta str directamente (sin encode previo)
+_loads = orjson.loads if orjson is not None else json.loads
+
+
+def _dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, ensure_ascii=False)
+
+
 def uid_for_evidence(ev):
     # prefer source+id when available
     if not ev:
@@ -80,68 +153,115 @@ def uid_for_evidence(ev):
 
 def main():
     driver = get_driver()
+    unique = ensure_schema(driver)
+    # el uid de una evidencia (github:<sha>, ...) se comparte entre empleados: sin constraint de
+    # unicidad dos hilos podrían MERGEar el mismo uid a la vez y duplicar el nodo, así que en ese
+    # caso se escribe en serie
+    workers = WRITE_WORKERS if 'evidence_uid' in unique else 1
+    if workers < WRITE_WORKERS:
+        print('warning: sin constraint de unicidad en Evidence.uid; escribo con un solo hilo')
     migrated = 0
     created_evidence = 0
     touched_relations = 0
 
-    # read all relations with evidences not yet migrated
+    # read all relations with evidences not yet migrated: una fila por evidencia (UNWIND en el
+    # servidor), así fetch_size trae evidencias sueltas y no listas enteras por relación.
+    # ORDER BY garantiza que las filas de una misma relación salgan contiguas (sin él Cypher no
+    # promete orden): así cada relación se agrupa entera en un solo lote y se marca _migrated en la
+    # misma transacción que todas sus evidencias.
     read_q = """
     MATCH (e:Empleado)-[r:DEMUESTRA_COMPETENCIA]->(s:Skill)
     WHERE r.evidencias IS NOT NULL AND coalesce(r._migrated, false) = false
-    RETURN e.id AS eid, s.name AS skill, r.evidencias AS evidencias
+    UNWIND r.evidencias AS ev_raw
+    RETURN e.id AS eid, s.name AS skill, ev_raw
+    ORDER BY eid, skill
     """
 
-    with driver.session() as s:
-        res = s.run(read_q)
-        rows = list(res)
-
-    print(f'Encontradas {len(rows)} relaciones con evidencias no migradas')
-
-    for row in rows:
-        eid = row['eid']
-        skill = row['skill']
-        evids = row.get('evidencias') or []
-        if not evids:
-            continue
-        touched_relations += 1
-        for item in evids:
-            ev = parse_evidence_item(item)
+    # una sola sentencia por lote: marca cada relación y crea sus Evidence (misma transacción,
+    # así una relación nunca queda marcada sin sus evidencias)
+    cy = '''
+    UNWIND $rows AS rel
+    MATCH (e:Empleado {id:rel.eid})-[r:DEMUESTRA_COMPETENCIA]->(s:Skill {name:rel.skill})
+    SET r._migrated = true
+    WITH e, s, rel
+    UNWIND rel.evidences AS row
+    MERGE (ev:Evidence {uid:row.uid})
+    SET ev.url = row.url, ev.date = row.date, ev.actor = row.actor, ev.type = row.type, ev.source = row.source, ev.raw = row.raw
+    MERGE (e)-[he:HAS_EVIDENCE]->(ev)
+    MERGE (ev)-[ab:ABOUT]->(s)
+    '''
+
+    def write_batch(batch):
+        # cada worker usa su propia sesión; el driver es compartido entre hilos.
+        # execute_write reintenta con backoff ante errores transitorios (deadlocks/locks entre
+        # hilos); el lote es idempotente (MERGE + SET), así que repetirlo es seguro
+        with driver.session() as ws:
+            ws.execute_write(lambda tx: tx.run(cy, rows=batch).consume())
+
+    # lectura en streaming en una sesión; escrituras en `workers` hilos. Los lotes se
+    # particionan por hash(eid) y cada partición escribe en serie (espera su lote anterior),
+    # así un mismo empleado nunca se MERGEa desde dos hilos a la vez; las Evidence compartidas
+    # entre particiones las protege el constraint de unicidad sobre uid.
+    pending = [[] for _ in range(workers)]
+    pending_ev = [0] * workers
+    inflight = [None] * workers
+    with ThreadPoolExecutor(max_workers=workers) as ex, driver.session() as rs:
+        def flush(p):
+            nonlocal created_evidence, migrated
+            if not pending[p]:
+                return
+            if inflight[p] is not None:
+                inflight[p].result()  # propaga errores del lote anterior
+            inflight[p] = ex.submit(write_batch, pending[p])
+            created_evidence += pending_ev[p]
+            migrated += len(pending[p])
+            pending[p] = []
+            pending_ev[p] = 0
+
+        def close_relation(rel):
+            eid, skill, ev_rows = rel
+            p = hash(eid) % workers
+            pending[p].append({'eid': eid, 'skill': skill, 'evidences': ev_rows})
+            pending_ev[p] += len(ev_rows)
+            # se vacía en bordes de relación, así que un lote nunca parte una relación
+            if pending_ev[p] >= BATCH_SIZE:
+                flush(p)
+
+        current, seen_uids = None, set()
+        for row in rs.run(read_q):
+            eid = row['eid']
+            skill = row['skill']
+            if current is None or current[0] != eid or current[1] != skill:
+                if current is not None:
+                    close_relation(current)
+                current, seen_uids = (eid, skill, []), set()
+                touched_relations += 1
+            ev = parse_evidence_item(row['ev_raw'])
             if not ev:
                 continue
             uid = uid_for_evidence(ev)
-            ev_date = ev.get('date')
-            # normalize date to yyyy-mm-dd if possible
-            if ev_date:
-                ev_date = str(ev_date)[:10]
-            url = ev.get('url')
-            actor = ev.get('actor')
-            etype = ev.get('type') or 'unknown'
-            source = ev.get('source') or 'legacy'
-            raw = ev.get('raw') or json.dumps(ev, ensure_ascii=False)
-
-            # create Evidence node if not exists and relationships
-            cy = '''
-            MERGE (ev:Evidence {uid:$uid})
-            SET ev.url = $url, ev.date = $date, ev.actor = $actor, ev.type = $type, ev.source = $source, ev.raw = $raw
-            WITH ev
-            MATCH (e:Empleado {id:$eid}), (s:Skill {name:$skill})
-            MERGE (e)-[he:HAS_EVIDENCE]->(ev)
-            MERGE (ev)-[ab:ABOUT]->(s)
-            RETURN ev, he, ab
-            '''
-            with driver.session() as s:
-                s.run(cy, uid=uid, url=url, date=ev_date, actor=actor, type=etype, source=source, raw=raw, eid=eid, skill=skill)
-                created_evidence += 1
-        # mark the original relation as migrated
-        mark_q = '''
-        MATCH (e:Empleado {id:$eid})-[r:DEMUESTRA_COMPETENCIA]->(s:Skill {name:$skill})
-        SET r._migrated = true
-        RETURN r
-        '''
-        with driver.session() as s:
-            s.run(mark_q, eid=eid, skill=skill)
-        migrated += 1
+            # la misma evidencia repetida en r.evidencias solo se MERGEa una vez
+            if uid in seen_uids:
+                continue
+            seen_uids.add(uid)
+            current[2].append({
+                'uid': uid,
+                'url': ev.get('url'),
+                'date': ev.get('date'),
+                'actor': ev.get('actor'),
+                'type': ev.get('type') or 'unknown',
+                'source': ev.get('source') or 'legacy',
+                'raw': ev['raw'],
+            })
+        if current is not None:
+            close_relation(current)
+        for p in range(workers):
+            flush(p)
+        for f in inflight:
+            if f is not None:
+                f.result()
 
+    print(f'Encontradas {touched_relations} relaciones con evidencias no migradas')
     print('--- Informe de migración ---')
     print('Relaciones procesadas:', touched_relations)
     print('Nuevos nodos Evidence creados (intentos):', created_evidence)